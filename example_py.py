@@ -34,10 +34,25 @@ with respect to factor order is given.
 [1, 2, 4, 8, 15, 27, 48, 87, 157, 283, 511]
 >>> specification.count_objects_of_size(n=15)
 9798
+
+The counts can also be found from the class itself, without a specification.
+
+>>> start_class.count_objects_up_to(10)
+[1, 2, 4, 8, 15, 27, 48, 87, 157, 283, 511]
+>>> [start_class.count_objects_of_size(i) for i in range(11)]
+[1, 2, 4, 8, 15, 27, 48, 87, 157, 283, 511]
+>>> start_class = AvoidingWithPrefix('b', ['ab'], ['a', 'b', 'c'])
+>>> start_class.count_objects_up_to(6)
+[0, 1, 3, 8, 21, 55, 144]
+>>> [start_class.count_objects_of_size(i) for i in range(7)]
+[0, 1, 3, 8, 21, 55, 144]
 """
-from itertools import product
-from typing import Iterable, Iterator, Optional, Tuple, Union
+import weakref
+from collections import deque
+from functools import lru_cache
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
 
+import numpy as np
 from comb_spec_searcher import (
     AtomStrategy,
     CartesianProductStrategy,
@@ -50,6 +65,75 @@ from comb_spec_searcher import (
 from comb_spec_searcher.bijection import ParallelSpecFinder
 from comb_spec_searcher.isomorphism import Bijection
 
+from memo import DecompositionMemo, MemoizedStrategy
+from specialize import bitmask_kernel
+
+
+def word_code(word: str, alphabet: Tuple[str, ...], bits: int) -> int:
+    """Return the word as an integer with bits bits per letter, the first
+    letter being the most significant."""
+    index = {letter: i for i, letter in enumerate(alphabet)}
+    code = 0
+    for letter in word:
+        code = (code << bits) | index[letter]
+    return code
+
+
+@lru_cache(maxsize=None)
+def pattern_codes(
+    patterns: Tuple[str, ...], alphabet: Tuple[str, ...]
+) -> Tuple[int, Optional[Tuple[Tuple[int, int], ...]]]:
+    """Return the number of bits needed per letter and, when the size of the
+    alphabet is a power of two so that words fit in an int64, the patterns as
+    pairs of their code and their length. The codes are None otherwise."""
+    bits = (len(alphabet) - 1).bit_length()
+    if 1 << bits != len(alphabet) or any(bits * len(p) > 62 for p in patterns):
+        return bits, None
+    return bits, tuple(
+        (word_code(patt, alphabet, bits), len(patt)) for patt in patterns
+    )
+
+
+@lru_cache(maxsize=None)
+def pattern_automaton(
+    patterns: Tuple[str, ...], alphabet: Tuple[str, ...]
+) -> Tuple[Tuple[Tuple[int, ...], ...], Tuple[bool, ...]]:
+    """Return the Aho-Corasick automaton of the patterns over the alphabet as
+    the table of transitions indexed by state and letter index, and the tuple
+    telling which states are reached when the letters read so far end with a
+    pattern. The initial state is 0."""
+    index = {letter: i for i, letter in enumerate(alphabet)}
+    transitions = [[-1] * len(alphabet)]
+    accepting = [False]
+    for patt in patterns:
+        state = 0
+        for letter in patt:
+            if transitions[state][index[letter]] == -1:
+                transitions[state][index[letter]] = len(transitions)
+                transitions.append([-1] * len(alphabet))
+                accepting.append(False)
+            state = transitions[state][index[letter]]
+        accepting[state] = True
+    # complete the trie with the failure links, in breadth first order so that
+    # the failure of a state is always handled before the state
+    failure = [0] * len(transitions)
+    queue = deque()
+    for a, child in enumerate(transitions[0]):
+        if child == -1:
+            transitions[0][a] = 0
+        else:
+            queue.append(child)
+    while queue:
+        state = queue.popleft()
+        accepting[state] = accepting[state] or accepting[failure[state]]
+        for a, child in enumerate(transitions[state]):
+            if child == -1:
+                transitions[state][a] = transitions[failure[state]][a]
+            else:
+                failure[child] = transitions[failure[state]][a]
+                queue.append(child)
+    return tuple(map(tuple, transitions)), tuple(accepting)
+
 
 class Word(str, CombinatorialObject):
     def size(self):
@@ -150,42 +234,141 @@ class AvoidingWithPrefix(CombinatorialClass[Word]):
 
     def objects_of_size(self, size):
         """Yield the words of given size that start with prefix and avoid the
-        patterns. If just_prefix, then only yield that word."""
-
-        def possible_words():
-            """Yield all words of given size over the alphabet with prefix"""
-            if len(self.prefix) > size:
-                return
-            for letters in product(self.alphabet, repeat=size - len(self.prefix)):
-                yield Word(self.prefix + "".join(a for a in letters))
+        patterns. If just_prefix, then only yield that word.
 
+        The words are built letter by letter along the automaton of the
+        patterns, so that only the prefixes of avoiding words are visited."""
         if self.just_prefix:
             if size == len(self.prefix) and not self.is_empty():
                 yield Word(self.prefix)
             return
-        for word in possible_words():
-            if all(patt not in word for patt in self.patterns):
-                yield word
+        if len(self.prefix) > size or self.is_empty():
+            return
+        transitions, accepting = pattern_automaton(self.patterns, self.alphabet)
+        state = 0
+        for i in self.letter_indices(self.prefix):
+            state = transitions[state][i]
+        # the letters are pushed in reverse order to yield the words in
+        # lexicographic order
+        stack = [(self.prefix, state)]
+        while stack:
+            word, state = stack.pop()
+            if len(word) == size:
+                yield Word(word)
+                continue
+            for i in reversed(range(len(self.alphabet))):
+                child = transitions[state][i]
+                if not accepting[child]:
+                    stack.append((word + self.alphabet[i], child))
+
+    def count_objects_of_size(self, size: int) -> int:
+        """Return the number of words of given size that start with prefix and
+        avoid the patterns, without building the words.
+
+        Over an alphabet whose size is a power of two the words are brute
+        forced by a kernel specialised to the patterns, otherwise they are
+        counted along the automaton of the patterns."""
+        if self.just_prefix:
+            return int(size == len(self.prefix) and not self.is_empty())
+        if len(self.prefix) > size:
+            return 0
+        bits, codes = pattern_codes(self.patterns, self.alphabet)
+        if codes is not None and bits * size <= 62:
+            suffixes = 1 << (bits * (size - len(self.prefix)))
+            start = word_code(self.prefix, self.alphabet, bits) * suffixes
+            count = bitmask_kernel(bits, codes)
+            return count(start, start + suffixes, size)
+        return self.count_objects_up_to(size)[size]
+
+    def count_objects_up_to(self, size: int) -> List[int]:
+        """Return the number of words of each size from 0 to size in the class.
+
+        This is a single sweep over the automaton of the patterns, keeping
+        track of how many avoiding words of the current length end in each of
+        its states."""
+        counts = [0] * (size + 1)
+        if len(self.prefix) > size or self.is_empty():
+            return counts
+        if self.just_prefix:
+            counts[len(self.prefix)] = 1
+            return counts
+        transitions, accepting = pattern_automaton(self.patterns, self.alphabet)
+        state = 0
+        for i in self.letter_indices(self.prefix):
+            state = transitions[state][i]
+        histogram = [0] * len(accepting)
+        histogram[state] = 1
+        for n in range(len(self.prefix), size + 1):
+            counts[n] = sum(histogram)
+            following = [0] * len(accepting)
+            for state, count in enumerate(histogram):
+                if count:
+                    for child in transitions[state]:
+                        following[child] += count
+            histogram = [0 if acc else c for c, acc in zip(following, accepting)]
+        return counts
+
+    # helpers, words are encoded as indices in the alphabet
+
+    def letter_indices(self, word: str) -> np.ndarray:
+        """Return the word as an array of indices in the alphabet."""
+        index = {letter: i for i, letter in enumerate(self.alphabet)}
+        return np.array([index[letter] for letter in word], dtype=np.uint8)
+
+
+# the instances of AvoidingWithPrefix still alive, keyed by their arguments
+_interned: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+
+
+def interned_avoiding_with_prefix(
+    prefix: str,
+    patterns: Iterable[str],
+    alphabet: Iterable[str],
+    just_prefix: bool = False,
+) -> AvoidingWithPrefix:
+    """Return the AvoidingWithPrefix with the given arguments, reusing the
+    existing instance if there is one still alive."""
+    key = (prefix, tuple(sorted(patterns)), tuple(sorted(alphabet)), just_prefix)
+    comb_class = _interned.get(key)
+    if comb_class is None:
+        comb_class = AvoidingWithPrefix(prefix, patterns, alphabet, just_prefix)
+        _interned[key] = comb_class
+    return comb_class
 
 
 # the strategies
 
 
-class ExpansionStrategy(DisjointUnionStrategy[AvoidingWithPrefix, Word]):
+class ExpansionStrategy(
+    MemoizedStrategy, DisjointUnionStrategy[AvoidingWithPrefix, Word]
+):
+    memo_names = ("_memo", "_letter_index")
+
+    def reset_memos(self) -> None:
+        self._memo: DecompositionMemo[AvoidingWithPrefix] = DecompositionMemo()
+        self._letter_index: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
     def decomposition_function(
         self, avoiding_with_prefix: AvoidingWithPrefix
     ) -> Optional[Tuple[AvoidingWithPrefix, ...]]:
         if not avoiding_with_prefix.just_prefix:
+            cached = self._memo.get(avoiding_with_prefix)
+            if cached is not None:
+                return cached
             alphabet, prefix, patterns = (
                 avoiding_with_prefix.alphabet,
                 avoiding_with_prefix.prefix,
                 avoiding_with_prefix.patterns,
             )
-            children = [AvoidingWithPrefix(prefix, patterns, alphabet, True)]
+            children = [interned_avoiding_with_prefix(prefix, patterns, alphabet, True)]
             for a in alphabet:
-                ends_with_a = AvoidingWithPrefix(prefix + a, patterns, alphabet)
+                ends_with_a = interned_avoiding_with_prefix(
+                    prefix + a, patterns, alphabet
+                )
                 children.append(ends_with_a)
-            return tuple(children)
+            res = tuple(children)
+            self._memo[avoiding_with_prefix] = res
+            return res
 
     def formal_step(self) -> str:
         return "Either just the prefix, or append a letter from the alphabet"
@@ -205,15 +388,16 @@ class ExpansionStrategy(DisjointUnionStrategy[AvoidingWithPrefix, Word]):
             children = self.decomposition_function(avoiding_with_prefix)
             assert children is not None
         if len(word) == len(avoiding_with_prefix.prefix):
-            return (word,) + tuple(None for i in range(len(children) - 1))
-        for idx, child in enumerate(children[1:]):
-            if word[: len(child.prefix)] == child.prefix:
-                break
-        return (
-            tuple(None for _ in range(idx + 1))
-            + (word,)
-            + tuple(None for _ in range(len(children) - idx - 1))
-        )
+            return (word,) + (None,) * (len(children) - 1)
+        letter_index = self._letter_index.get(avoiding_with_prefix)
+        if letter_index is None:
+            # each child extends the prefix by exactly one letter
+            letter_index = {
+                child.prefix[-1]: idx for idx, child in enumerate(children[1:])
+            }
+            self._letter_index[avoiding_with_prefix] = letter_index
+        idx = letter_index[word[len(avoiding_with_prefix.prefix)]]
+        return (None,) * (idx + 1) + (word,) + (None,) * (len(children) - idx - 1)
 
     def __str__(self) -> str:
         return self.formal_step()
@@ -226,13 +410,23 @@ class ExpansionStrategy(DisjointUnionStrategy[AvoidingWithPrefix, Word]):
         return cls()
 
 
-class RemoveFrontOfPrefix(CartesianProductStrategy[AvoidingWithPrefix, Word]):
+class RemoveFrontOfPrefix(
+    MemoizedStrategy, CartesianProductStrategy[AvoidingWithPrefix, Word]
+):
+    memo_names = ("_memo",)
+
+    def reset_memos(self) -> None:
+        self._memo: DecompositionMemo[AvoidingWithPrefix] = DecompositionMemo()
+
     def decomposition_function(
         self, avoiding_with_prefix: AvoidingWithPrefix
     ) -> Union[Tuple[AvoidingWithPrefix, ...], None]:
         """If the k is the maximum length of a pattern to be avoided, then any
         occurrence using indices further to the right of the prefix can use at
         most the last k - 1 letters in the prefix."""
+        cached = self._memo.get(avoiding_with_prefix)
+        if cached is not None:
+            return cached
         if not avoiding_with_prefix.just_prefix:
             safe = self.index_safe_to_remove_up_to(avoiding_with_prefix)
             if safe > 0:
@@ -243,8 +437,12 @@ class RemoveFrontOfPrefix(CartesianProductStrategy[AvoidingWithPrefix, Word]):
                 )
                 start_prefix = prefix[:safe]
                 end_prefix = prefix[safe:]
-                start = AvoidingWithPrefix(start_prefix, patterns, alphabet, True)
-                end = AvoidingWithPrefix(end_prefix, patterns, alphabet)
+                start = interned_avoiding_with_prefix(
+                    start_prefix, patterns, alphabet, True
+                )
+                end = interned_avoiding_with_prefix(end_prefix, patterns, alphabet)
+                # only worth remembering when the strategy applies
+                self._memo[avoiding_with_prefix] = (start, end)
                 return (start, end)
 
     def index_safe_to_remove_up_to(self, avoiding_with_prefix: AvoidingWithPrefix):
@@ -279,9 +477,6 @@ class RemoveFrontOfPrefix(CartesianProductStrategy[AvoidingWithPrefix, Word]):
         assert len(words) == 2
         assert isinstance(words[0], Word)
         assert isinstance(words[1], Word)
-        if children is None:
-            children = self.decomposition_function(avoiding_with_prefix)
-            assert children is not None
         yield Word(words[0] + words[1])
 
     def forward_map(
@@ -34,7 +34,30 @@ with respect to factor order is given.
 [1, 2, 4, 8, 15, 27, 48, 87, 157, 283, 511]
 >>> specification.count_objects_of_size(n=15)
 9798
+
+The counts can also be found from the class itself, without a specification.
+
+>>> start_class.count_objects_up_to(10)
+[1, 2, 4, 8, 15, 27, 48, 87, 157, 283, 511]
+>>> [start_class.count_objects_of_size(i) for i in range(11)]
+[1, 2, 4, 8, 15, 27, 48, 87, 157, 283, 511]
+>>> start_class = AvoidingWithPrefix('b', ['ab'], ['a', 'b', 'c'])
+>>> start_class.count_objects_up_to(6)
+[0, 1, 3, 8, 21, 55, 144]
+>>> [start_class.count_objects_of_size(i) for i in range(7)]
+[0, 1, 3, 8, 21, 55, 144]
+
+The bijections of the strategies cut and glue the words without leaving Rust.
+
+>>> word = Word('ab').concat(Word('b'))
+>>> str(word), len(word)
+('abb', 3)
+>>> str(word.slice(1)), str(word[1:]), word.slice(1) == word[1:]
+('bb', 'bb', True)
+>>> str(word.slice(5)), str(word[::-1])
+('', 'bba')
 """
+import weakref
 from itertools import product
 from typing import Iterable, Iterator, Optional, Tuple, Union
 
@@ -46,16 +69,31 @@ from comb_spec_searcher.bijection import ParallelSpecFinder
 from comb_spec_searcher.isomorphism import Bijection
 from word_scope_rs import AvoidingWithPrefix, Word  # type: ignore
 
+from memo import DecompositionMemo, MemoizedStrategy
+
 AvoidingWithPrefix.extra_parameters = tuple()
 
+
 # the strategies
 
-class ExpansionStrategy(DisjointUnionStrategy[AvoidingWithPrefix, Word]):
+class ExpansionStrategy(
+    MemoizedStrategy, DisjointUnionStrategy[AvoidingWithPrefix, Word]
+):
+    memo_names = ("_memo", "_letter_index")
+
+    def reset_memos(self) -> None:
+        self._memo: DecompositionMemo[AvoidingWithPrefix] = DecompositionMemo()
+        self._letter_index: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
     def decomposition_function(
         self, avoiding_with_prefix: AvoidingWithPrefix
     ) -> Optional[Tuple[AvoidingWithPrefix, ...]]:
         if not avoiding_with_prefix.just_prefix:
-            return tuple(avoiding_with_prefix.expand_one_letter())
+            children = self._memo.get(avoiding_with_prefix)
+            if children is None:
+                children = avoiding_with_prefix.expand_one_letter()
+                self._memo[avoiding_with_prefix] = children
+            return children
         return None
 
     def formal_step(self) -> str:
@@ -76,15 +114,16 @@ class ExpansionStrategy(DisjointUnionStrategy[AvoidingWithPrefix, Word]):
             children = self.decomposition_function(avoiding_with_prefix)
             assert children is not None
         if len(word) == len(avoiding_with_prefix.prefix):
-            return (word,) + tuple(None for i in range(len(children) - 1))
-        for idx, child in enumerate(children[1:]):
-            if word[: len(child.prefix)] == child.prefix:
-                break
-        return (
-            tuple(None for _ in range(idx + 1))
-            + (word,)
-            + tuple(None for _ in range(len(children) - idx - 1))
-        )
+            return (word,) + (None,) * (len(children) - 1)
+        letter_index = self._letter_index.get(avoiding_with_prefix)
+        if letter_index is None:
+            # each child extends the prefix by exactly one letter
+            letter_index = {
+                child.prefix[-1]: idx for idx, child in enumerate(children[1:])
+            }
+            self._letter_index[avoiding_with_prefix] = letter_index
+        idx = letter_index[word[len(avoiding_with_prefix.prefix)]]
+        return (None,) * (idx + 1) + (word,) + (None,) * (len(children) - idx - 1)
 
     def __str__(self) -> str:
         return self.formal_step()
@@ -97,16 +136,26 @@ class ExpansionStrategy(DisjointUnionStrategy[AvoidingWithPrefix, Word]):
         return cls()
 
 
-class RemoveFrontOfPrefix(CartesianProductStrategy[AvoidingWithPrefix, Word]):
+class RemoveFrontOfPrefix(
+    MemoizedStrategy, CartesianProductStrategy[AvoidingWithPrefix, Word]
+):
+    memo_names = ("_memo",)
+
+    def reset_memos(self) -> None:
+        self._memo: DecompositionMemo[AvoidingWithPrefix] = DecompositionMemo()
+
     def decomposition_function(
         self, avoiding_with_prefix: AvoidingWithPrefix
     ) -> Union[Tuple[AvoidingWithPrefix, ...], None]:
         """If the k is the maximum length of a pattern to be avoided, then any
         occurrence using indices further to the right of the prefix can use at
         most the last k - 1 letters in the prefix."""
-        children = avoiding_with_prefix.remove_front_of_prefix()
-        if children is not None:
-            children = tuple(children)
+        children = self._memo.get(avoiding_with_prefix)
+        if children is None:
+            children = avoiding_with_prefix.remove_front_of_prefix()
+            if children is not None:
+                # only worth remembering when the strategy applies
+                self._memo[avoiding_with_prefix] = children
         return children
 
     def formal_step(self) -> str:
@@ -123,12 +172,7 @@ class RemoveFrontOfPrefix(CartesianProductStrategy[AvoidingWithPrefix, Word]):
         generation and sampling.
         """
         assert len(words) == 2
-        assert isinstance(words[0], Word)
-        assert isinstance(words[1], Word)
-        if children is None:
-            children = self.decomposition_function(avoiding_with_prefix)
-            assert children is not None
-        yield Word(words[0] + words[1])
+        yield words[0].concat(words[1])
 
     def forward_map(
         self,
@@ -140,11 +184,11 @@ class RemoveFrontOfPrefix(CartesianProductStrategy[AvoidingWithPrefix, Word]):
         The backward direction of the underlying bijection used for object
         generation and sampling.
         """
-        assert isinstance(word, Word)
         if children is None:
-            children = self.decomposition_function(comb_class)
-            assert children is not None
-        return Word(children[0].prefix), Word(word[len(children[0].prefix) :])
+            safe = comb_class.removable_prefix_length()
+            assert safe > 0 and not comb_class.just_prefix
+            return Word(comb_class.prefix[:safe]), word.slice(safe)
+        return Word(children[0].prefix), word.slice(len(children[0].prefix))
 
     @classmethod
     def from_dict(cls, d):
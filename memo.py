@@ -0,0 +1,70 @@
+"""
+Memos shared by the strategies of example_py and example_rs.
+
+The strategies of a pack outlive the searches that use them, so the memos only
+hold weak references to the combinatorial classes.
+"""
+import weakref
+from typing import Any, Dict, Generic, Optional, Tuple, TypeVar
+
+CombClassType = TypeVar("CombClassType")
+
+
+class DecompositionMemo(Generic[CombClassType]):
+    """The children a strategy found for the classes it decomposed. The
+    classes and their children are only weakly referenced, so that the memo of
+    a strategy in a pack never keeps the classes of a search alive."""
+
+    def __init__(self) -> None:
+        self._refs: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+    def get(self, comb_class: CombClassType) -> Optional[Tuple[CombClassType, ...]]:
+        """Return the children remembered for the class, if they are all still
+        alive."""
+        refs = self._refs.get(comb_class)
+        if refs is None:
+            return None
+        children = tuple(ref() for ref in refs)
+        if any(child is None for child in children):
+            return None
+        return children
+
+    def __setitem__(
+        self, comb_class: CombClassType, children: Tuple[CombClassType, ...]
+    ) -> None:
+        self._refs[comb_class] = tuple(weakref.ref(child) for child in children)
+
+
+class MemoizedStrategy:
+    """Mixin for the strategies keeping memos in the attributes named in
+    memo_names, which are set up by reset_memos. The memos are only caches, so
+    they do not make two instances of a strategy different and they are not
+    pickled: an unpickled strategy starts with empty memos."""
+
+    memo_names: Tuple[str, ...] = ()
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.reset_memos()
+
+    def reset_memos(self) -> None:
+        """Set all the memos of the strategy to empty ones."""
+        raise NotImplementedError
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        for name in self.memo_names:
+            del state[name]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self.reset_memos()
+
+    def __eq__(self, other: object) -> bool:
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return True
+
+    def __hash__(self) -> int:
+        return hash(self.__class__)
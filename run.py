@@ -18,9 +18,6 @@ if language == "rs":
     pack = pack_rs
 elif language == "py":
     AvoidingWithPrefix = AvoidingWithPrefix_py
-    AvoidingWithPrefix_py.count_objects_of_size = lambda self, n: sum(
-        1 for _ in self.objects_of_size(n)
-    )
     pack = pack_py
 else:
     raise ValueError(f"Invalid language '{language}'")
@@ -36,20 +33,18 @@ start_time = time.perf_counter()
 spec = searcher.auto_search()
 search_time = time.perf_counter() - start_time
 
-count_time = 0.0
-brute_force_time = 0.0
-for n in range(20):
-    # Count
-    start_time = time.perf_counter()
-    count = spec.count_objects_of_size(n)
-    count_time += time.perf_counter() - start_time
-    # Brute force
-    start_time = time.perf_counter()
-    brute_force = start_class.count_objects_of_size(n)
-    brute_force_time = time.perf_counter() - start_time
-    # Print and assert
-    # print(n, count, brute_force)
-    assert count == brute_force
+max_size = 19
+# Count
+start_time = time.perf_counter()
+counts = [spec.count_objects_of_size(n) for n in range(max_size + 1)]
+count_time = time.perf_counter() - start_time
+# Brute force, all the sizes in one sweep
+start_time = time.perf_counter()
+brute_force = start_class.count_objects_up_to(max_size)
+brute_force_time = time.perf_counter() - start_time
+# Print and assert
+# print(counts, brute_force)
+assert counts == brute_force
 
 print(f"Search time: {search_time}")
 print(f"Count time: {count_time}")
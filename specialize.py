@@ -0,0 +1,117 @@
+"""
+Generation of brute-force counting kernels specialised to a fixed set of
+patterns.
+
+A generic kernel would read the patterns from arrays and loop over them for
+every word. Here the source of a kernel is written with the masks and values of
+the patterns inlined as constants and the loop over the patterns unrolled, then
+compiled with Numba.
+
+The source of each kernel is written to a module in KERNEL_DIR, or in
+FALLBACK_KERNEL_DIR when KERNEL_DIR is not writable, and imported from there,
+so that Numba sees a real file as it does for any other module. The
+kernels are compiled eagerly on import with cache=True, so only the first
+process to count with a set of patterns compiles its kernel.
+"""
+import hashlib
+import importlib.util
+import os
+import sys
+import tempfile
+from functools import lru_cache
+from typing import Callable, Tuple
+
+KERNEL_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "__pycache__", "kernels"
+)
+FALLBACK_KERNEL_DIR = os.path.join(tempfile.gettempdir(), "word_scope_kernels")
+
+KERNEL_TEMPLATE = """from numba import njit
+
+
+@njit("int64(int64, int64, int64)", cache=True)
+def count_avoiders_specialised(start, stop, size):
+    good = 0
+    for w in range(start, stop):
+        ok = True
+        x = w
+        for s in range(size - {min_length} + 1):
+            if {occurs}:
+                ok = False
+                break
+            x >>= {bits}
+        if ok:
+            good += 1
+    return good
+"""
+
+
+def kernel_module_path(source: str) -> str:
+    """Return the path of the module with the given source, writing it if it
+    does not exist yet. An existing module is never rewritten, as that would
+    make it look modified to anything caching on its behalf.
+
+    The module goes in KERNEL_DIR, or in FALLBACK_KERNEL_DIR if KERNEL_DIR can
+    not be written to, e.g. when the package is installed read-only."""
+    name = "kernel_" + hashlib.sha1(source.encode()).hexdigest()[:16]
+    error = None
+    for directory in (KERNEL_DIR, FALLBACK_KERNEL_DIR):
+        path = os.path.join(directory, name + ".py")
+        if os.path.exists(path):
+            return path
+        try:
+            write_module(directory, path, source)
+        except OSError as e:
+            error = e
+            continue
+        return path
+    assert error is not None
+    raise error
+
+
+def write_module(directory: str, path: str, source: str) -> None:
+    """Write the source to path, creating the directory if needed."""
+    os.makedirs(directory, exist_ok=True)
+    # write then rename, so that a concurrent process never imports half of the
+    # module
+    partial = f"{path}.{os.getpid()}"
+    try:
+        with open(partial, "w") as f:
+            f.write(source)
+        os.replace(partial, path)
+    except OSError:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+
+
+@lru_cache(maxsize=None)
+def bitmask_kernel(
+    bits: int, patterns: Tuple[Tuple[int, int], ...]
+) -> Callable[[int, int, int], int]:
+    """Return a compiled function counting the words w in range(start, stop)
+    of the given size that avoid the patterns. Words are encoded with bits bits
+    per letter, the first letter being the most significant, and each pattern
+    is given as the pair of its code and its length."""
+    checks = [
+        f"((x & {(1 << (bits * length)) - 1}) == {code} and s + {length} <= size)"
+        for code, length in patterns
+    ]
+    source = KERNEL_TEMPLATE.format(
+        min_length=min((length for _, length in patterns), default=1),
+        occurs=" or ".join(checks) or "False",
+        bits=bits,
+    )
+    path = kernel_module_path(source)
+    name = os.path.splitext(os.path.basename(path))[0]
+    spec = importlib.util.spec_from_file_location(name, path)
+    assert spec is not None and spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    # Numba finds the module by name when loading a kernel from its cache
+    sys.modules[name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[name]
+        raise
+    return module.count_avoiders_specialised
@@ -1,7 +1,12 @@
 use pyo3::basic::CompareOp;
-use pyo3::exceptions::{PyIndexError, PyNotImplementedError};
+use pyo3::exceptions::{PyIndexError, PyNotImplementedError, PyOverflowError, PyValueError};
 use pyo3::prelude::*;
+use pyo3::types::{PyIterator, PyList, PySlice, PyTuple};
+use std::cell::Cell;
 use std::cmp;
+use std::collections::VecDeque;
+use std::os::raw::c_long;
+use std::sync::Arc;
 
 use std::collections::hash_map::DefaultHasher;
 
@@ -10,18 +15,28 @@ use std::hash::{Hash, Hasher};
 
 #[pyclass(sequence)]
 struct Word {
-    letters: Vec<char>,
+    // The letters are ASCII characters, so each of them is a single byte
+    letters: Vec<u8>,
+}
+
+/// An index into a word, either a single position or a slice.
+#[derive(FromPyObject)]
+enum WordIndex<'a> {
+    Position(isize),
+    Slice(&'a PySlice),
 }
 
 #[pymethods]
 impl Word {
     #[new]
-    fn py_new(word: Option<String>) -> Self {
-        let letters = match word {
-            None => vec![],
-            Some(w) => w.chars().collect(),
-        };
-        Word { letters }
+    fn py_new(word: Option<String>) -> PyResult<Self> {
+        let letters = word.unwrap_or_default().into_bytes();
+        if !letters.is_ascii() {
+            return Err(PyValueError::new_err(
+                "The letters of a word must be ASCII characters.",
+            ));
+        }
+        Ok(Word { letters })
     }
 
     fn __iter__(slf: PyRef<'_, Self>) -> PyResult<Py<WordIterator>> {
@@ -32,20 +47,28 @@ impl Word {
     }
 
     fn __str__(&self) -> String {
-        self.letters.iter().cloned().collect::<String>()
+        self.letters.iter().map(|&b| char::from(b)).collect()
     }
 
     fn __len__(&self) -> usize {
         self.letters.len()
     }
 
-    fn __add__(slf: PyRef<'_, Self>, object: String) -> Word {
-        let letters = slf
-            .letters
-            .clone()
-            .into_iter()
-            .chain(object.chars())
-            .collect();
+    fn __add__(&self, object: String) -> PyResult<Word> {
+        Ok(self.concat(&Word::py_new(Some(object))?))
+    }
+
+    /// Return the word followed by the other word.
+    fn concat(&self, other: &Word) -> Word {
+        let mut letters = Vec::with_capacity(self.letters.len() + other.letters.len());
+        letters.extend_from_slice(&self.letters);
+        letters.extend_from_slice(&other.letters);
+        Word { letters }
+    }
+
+    /// Return the suffix of the word starting at the given index.
+    fn slice(&self, start: usize) -> Word {
+        let letters = self.letters.get(start..).unwrap_or_default().to_vec();
         Word { letters }
     }
 
@@ -59,31 +82,37 @@ impl Word {
         hasher.finish()
     }
 
-    fn __getitem__(&self, index: isize) -> PyResult<char> {
-        let mut corrected_index = index;
-        if index < 0 {
-            corrected_index = index + isize::try_from(self.letters.len()).expect("Index to big");
-        }
-        println!("{corrected_index} {:?}", self.letters);
-        let corrected_index: usize = usize::try_from(corrected_index).expect("Invalid index");
-        match self.letters.get(corrected_index) {
-            None => Err(PyIndexError::new_err("Index out of range")),
-            Some(c) => Ok(*c),
+    fn __getitem__(&self, py: Python<'_>, index: WordIndex<'_>) -> PyResult<PyObject> {
+        let len = self.letters.len() as isize;
+        match index {
+            WordIndex::Position(i) => {
+                let i = if i < 0 { i + len } else { i };
+                if i < 0 || i >= len {
+                    return Err(PyIndexError::new_err("Index out of range"));
+                }
+                Ok(char::from(self.letters[i as usize]).into_py(py))
+            }
+            WordIndex::Slice(slice) => {
+                let indices = slice.indices(len as c_long)?;
+                let letters = (0..indices.slicelength)
+                    .map(|k| self.letters[(indices.start + k * indices.step) as usize])
+                    .collect();
+                Ok(Word { letters }.into_py(py))
+            }
         }
     }
 }
 
 impl Word {
     fn contains(&self, pattern: &Self) -> bool {
-        let word_str: String = self.letters.iter().collect();
-        let pattern_str: String = pattern.letters.iter().collect();
-        word_str.contains(&pattern_str)
+        let n = pattern.letters.len();
+        n == 0 || self.letters.windows(n).any(|w| w == pattern.letters)
     }
 }
 
 #[pyclass]
 struct WordIterator {
-    inner: std::vec::IntoIter<char>,
+    inner: std::vec::IntoIter<u8>,
 }
 
 #[pymethods]
@@ -93,21 +122,47 @@ impl WordIterator {
     }
 
     fn __next__(mut slf: PyRefMut<'_, Self>) -> Option<char> {
-        slf.inner.next()
+        slf.inner.next().map(char::from)
     }
 }
 
-#[pyclass]
-#[derive(PartialEq, Eq, Hash)]
+// Weakly referenceable so that the strategies can remember decompositions
+// without keeping the classes alive
+#[pyclass(weakref)]
 pub struct AvoidingWithPrefix {
-    // #[pyo3(get)]
-    prefix: String,
     #[pyo3(get)]
-    patterns: Vec<String>,
-    #[pyo3(get)]
-    alphabet: Vec<char>,
+    prefix: String,
+    // The patterns, alphabet and automaton are shared with all the classes
+    // derived from this one
+    patterns: Arc<[String]>,
+    alphabet: Arc<[char]>,
     #[pyo3(get, name = "just_prefix")]
     is_just_prefix: bool,
+    automaton: Arc<PatternAutomaton>,
+    /// Computed on the first call to removable_prefix_length
+    removable_length: Cell<Option<usize>>,
+}
+
+// The automaton is determined by the patterns and the alphabet, so it is left
+// out of the comparisons.
+impl PartialEq for AvoidingWithPrefix {
+    fn eq(&self, other: &Self) -> bool {
+        self.prefix == other.prefix
+            && self.patterns == other.patterns
+            && self.alphabet == other.alphabet
+            && self.is_just_prefix == other.is_just_prefix
+    }
+}
+
+impl Eq for AvoidingWithPrefix {}
+
+impl Hash for AvoidingWithPrefix {
+    fn hash<H: Hasher>(&self, state: &mut H) {
+        self.prefix.hash(state);
+        self.patterns.hash(state);
+        self.alphabet.hash(state);
+        self.is_just_prefix.hash(state);
+    }
 }
 
 #[pymethods]
@@ -119,8 +174,41 @@ impl AvoidingWithPrefix {
         patterns: Vec<String>,
         alphabet: Vec<char>,
         just_prefix: bool,
-    ) -> AvoidingWithPrefix {
-        AvoidingWithPrefix::new(prefix, patterns, alphabet, just_prefix)
+    ) -> PyResult<AvoidingWithPrefix> {
+        // the objects are built as words from the letters of the alphabet
+        if !alphabet.iter().all(char::is_ascii) {
+            return Err(PyValueError::new_err(
+                "The letters of the alphabet must be ASCII characters.",
+            ));
+        }
+        // the letters are indexed by u8
+        if alphabet.len() > usize::from(u8::MAX) {
+            return Err(PyValueError::new_err(
+                "The alphabet must have at most 255 letters.",
+            ));
+        }
+        // the automaton is indexed by the letters of the prefix
+        if !prefix.chars().all(|c| alphabet.contains(&c)) {
+            return Err(PyValueError::new_err(
+                "Prefix must be a word over the given alphabet.",
+            ));
+        }
+        Ok(AvoidingWithPrefix::new(
+            prefix,
+            patterns,
+            alphabet,
+            just_prefix,
+        ))
+    }
+
+    #[getter]
+    fn patterns(&self) -> Vec<String> {
+        self.patterns.to_vec()
+    }
+
+    #[getter]
+    fn alphabet(&self) -> Vec<char> {
+        self.alphabet.to_vec()
     }
 
     fn is_empty(&self) -> bool {
@@ -132,6 +220,9 @@ impl AvoidingWithPrefix {
     }
 
     fn removable_prefix_length(&self) -> usize {
+        if let Some(safe) = self.removable_length.get() {
+            return safe;
+        }
         let m = self.patterns.iter().map(|s| s.len()).max().unwrap_or(1);
         let mut safe = if self.prefix.len() > m {
             self.prefix.len() - m + 0
@@ -149,21 +240,22 @@ impl AvoidingWithPrefix {
             }
             safe = i + 1;
         }
+        self.removable_length.set(Some(safe));
         safe
     }
 
-    fn expand_one_letter(&self) -> Vec<AvoidingWithPrefix> {
-        let mut res = Vec::with_capacity(self.alphabet.len() + 1);
-        res.push(self.with_same_base(&self.prefix, true));
+    fn expand_one_letter<'py>(&self, py: Python<'py>) -> &'py PyTuple {
+        let mut children: Vec<PyObject> = Vec::with_capacity(self.alphabet.len() + 1);
+        children.push(self.with_same_base(&self.prefix, true).into_py(py));
         for letter in self.alphabet.iter() {
             let mut prefix = self.prefix.clone();
             prefix.push(*letter);
-            res.push(self.with_same_base(&prefix, false));
+            children.push(self.with_same_base(&prefix, false).into_py(py));
         }
-        res
+        PyTuple::new(py, children)
     }
 
-    fn remove_front_of_prefix(&self) -> Option<Vec<AvoidingWithPrefix>> {
+    fn remove_front_of_prefix<'py>(&self, py: Python<'py>) -> Option<&'py PyTuple> {
         if self.is_just_prefix {
             return None;
         }
@@ -172,10 +264,11 @@ impl AvoidingWithPrefix {
             safe => {
                 let start_prefix = &self.prefix[..safe];
                 let end_prefix = &self.prefix[safe..];
-                Some(vec![
-                    self.with_same_base(start_prefix, true),
-                    self.with_same_base(end_prefix, false),
-                ])
+                let children: [PyObject; 2] = [
+                    self.with_same_base(start_prefix, true).into_py(py),
+                    self.with_same_base(end_prefix, false).into_py(py),
+                ];
+                Some(PyTuple::new(py, children))
             }
         }
     }
@@ -209,8 +302,47 @@ impl AvoidingWithPrefix {
         Err(PyNotImplementedError::new_err("to bytes not implemented"))
     }
 
-    fn count_objects_of_size(&self, n: usize) -> usize {
-        self.objects_of_size(n).count()
+    #[pyo3(name = "objects_of_size")]
+    fn py_objects_of_size<'py>(&self, py: Python<'py>, size: usize) -> PyResult<&'py PyIterator> {
+        let words: Vec<PyObject> = self
+            .objects_of_size(size)
+            .into_iter()
+            .map(|w| {
+                Word {
+                    letters: w.into_bytes(),
+                }
+                .into_py(py)
+            })
+            .collect();
+        PyIterator::from_object(py, PyList::new(py, words))
+    }
+
+    pub fn count_objects_of_size(&self, size: usize) -> usize {
+        let mut count = 0;
+        self.for_each_object_of_size(size, |_| count += 1);
+        count
+    }
+
+    /// Return the number of objects of each size from 0 to size. Raise
+    /// OverflowError if one of them does not fit in a usize.
+    pub fn count_objects_up_to(&self, size: usize) -> PyResult<Vec<usize>> {
+        let mut counts = vec![0; size + 1];
+        let start = self.prefix.len();
+        if start > size || self.is_empty() {
+            return Ok(counts);
+        }
+        if self.is_just_prefix {
+            counts[start] = 1;
+            return Ok(counts);
+        }
+        if let Some(state) = self.automaton.run(&self.letter_indices(&self.prefix)) {
+            let extensions = self
+                .automaton
+                .count_avoiding_extensions(state, size - start)
+                .ok_or_else(|| PyOverflowError::new_err("The number of objects is too large."))?;
+            counts[start..].copy_from_slice(&extensions);
+        }
+        Ok(counts)
     }
 }
 
@@ -221,11 +353,14 @@ impl AvoidingWithPrefix {
         alphabet: Vec<char>,
         just_prefix: bool,
     ) -> AvoidingWithPrefix {
+        let automaton = Arc::new(PatternAutomaton::new(&patterns, &alphabet));
         AvoidingWithPrefix {
             prefix,
-            patterns,
-            alphabet,
+            patterns: patterns.into(),
+            alphabet: alphabet.into(),
             is_just_prefix: just_prefix,
+            automaton,
+            removable_length: Cell::new(None),
         }
     }
 
@@ -233,9 +368,11 @@ impl AvoidingWithPrefix {
     pub fn with_same_base(&self, prefix: &str, is_just_prefix: bool) -> AvoidingWithPrefix {
         AvoidingWithPrefix {
             prefix: String::from(prefix),
-            alphabet: self.alphabet.clone(),
-            patterns: self.patterns.clone(),
+            alphabet: Arc::clone(&self.alphabet),
+            patterns: Arc::clone(&self.patterns),
             is_just_prefix,
+            automaton: Arc::clone(&self.automaton),
+            removable_length: Cell::new(None),
         }
     }
 
@@ -252,74 +389,201 @@ impl AvoidingWithPrefix {
         true
     }
 
-    pub fn objects_of_size(&self, n: usize) -> impl Iterator<Item = String> + '_ {
-        let alphabet = self.alphabet.clone();
-        let prefix = self.prefix.chars().collect();
-        WordOfSizeIterator::new(alphabet, n, prefix).filter(|w| self.contains(w))
+    pub fn objects_of_size(&self, size: usize) -> Vec<String> {
+        let mut words = Vec::new();
+        self.for_each_object_of_size(size, |word| {
+            words.push(
+                word.iter()
+                    .map(|&i| self.alphabet[usize::from(i)])
+                    .collect(),
+            )
+        });
+        words
+    }
+
+    /// Return the word as the indices of its letters in the alphabet, which
+    /// must all be in it.
+    fn letter_indices(&self, word: &str) -> Vec<u8> {
+        word.chars()
+            .map(|c| {
+                self.alphabet
+                    .iter()
+                    .position(|&a| a == c)
+                    .map_or(u8::MAX, |i| i as u8)
+            })
+            .collect()
+    }
+
+    /// Call f on each word of the given size in the class, encoded as the
+    /// indices of its letters in the alphabet. Only the words avoiding the
+    /// patterns are visited, by walking the automaton of the patterns.
+    fn for_each_object_of_size(&self, size: usize, mut f: impl FnMut(&[u8])) {
+        if self.is_just_prefix {
+            if size == self.prefix.len() && !self.is_empty() {
+                f(&self.letter_indices(&self.prefix));
+            }
+            return;
+        }
+        if size < self.prefix.len() {
+            return;
+        }
+        let mut word = self.letter_indices(&self.prefix);
+        if let Some(state) = self.automaton.run(&word) {
+            word.reserve(size - word.len());
+            self.automaton
+                .for_each_avoiding_extension(&mut word, state, size, &mut f);
+        }
     }
 }
 
-/// Iterator over all the extension of of a given size of a prefix over the alphabet
-struct WordOfSizeIterator {
-    alphabet: Vec<char>,
-    prefix: Vec<char>,
-    current: Vec<usize>,
-    done: bool,
+/// The Aho-Corasick automaton of a set of patterns, over the indices of the
+/// letters of an alphabet. The initial state is 0.
+struct PatternAutomaton {
+    alphabet_size: usize,
+    /// The transition from state q with letter a is at q * alphabet_size + a
+    transitions: Vec<usize>,
+    /// Whether the letters read so far end with a pattern
+    accepting: Vec<bool>,
 }
 
-impl WordOfSizeIterator {
-    fn new(alphabet: Vec<char>, size: usize, prefix: Vec<char>) -> WordOfSizeIterator {
-        let done = size < prefix.len();
-        let current = if done {
-            vec![]
-        } else {
-            vec![0; size - prefix.len()]
-        };
-        WordOfSizeIterator {
-            alphabet,
-            prefix,
-            current,
-            done,
+impl PatternAutomaton {
+    fn new(patterns: &[String], alphabet: &[char]) -> PatternAutomaton {
+        let alphabet_size = alphabet.len();
+        // build the trie of the patterns, with usize::MAX for missing edges
+        let mut transitions = vec![usize::MAX; alphabet_size];
+        let mut accepting = vec![false];
+        for patt in patterns {
+            let letters: Option<Vec<usize>> = patt
+                .chars()
+                .map(|c| alphabet.iter().position(|&a| a == c))
+                .collect();
+            let letters = match letters {
+                Some(letters) => letters,
+                // a letter outside of the alphabet, the pattern never occurs
+                None => continue,
+            };
+            let mut state = 0;
+            for letter in letters {
+                let edge = state * alphabet_size + letter;
+                if transitions[edge] == usize::MAX {
+                    transitions[edge] = accepting.len();
+                    transitions.extend(std::iter::repeat(usize::MAX).take(alphabet_size));
+                    accepting.push(false);
+                }
+                state = transitions[edge];
+            }
+            accepting[state] = true;
+        }
+        // complete the trie with the failure links, in breadth first order so
+        // that the failure of a state is always handled before the state
+        let mut failure = vec![0; accepting.len()];
+        let mut queue = VecDeque::new();
+        for a in 0..alphabet_size {
+            match transitions[a] {
+                usize::MAX => transitions[a] = 0,
+                child => queue.push_back(child),
+            }
+        }
+        while let Some(state) = queue.pop_front() {
+            accepting[state] = accepting[state] || accepting[failure[state]];
+            for a in 0..alphabet_size {
+                let fallback = transitions[failure[state] * alphabet_size + a];
+                match transitions[state * alphabet_size + a] {
+                    usize::MAX => transitions[state * alphabet_size + a] = fallback,
+                    child => {
+                        failure[child] = fallback;
+                        queue.push_back(child);
+                    }
+                }
+            }
+        }
+        PatternAutomaton {
+            alphabet_size,
+            transitions,
+            accepting,
         }
     }
-}
 
-impl Iterator for WordOfSizeIterator {
-    type Item = String;
+    fn step(&self, state: usize, letter: u8) -> usize {
+        self.transitions[state * self.alphabet_size + usize::from(letter)]
+    }
 
-    fn next(&mut self) -> Option<Self::Item> {
-        if self.done {
+    /// Return the state reached after reading the word, or None if one of
+    /// the patterns occurs in it.
+    fn run(&self, word: &[u8]) -> Option<usize> {
+        let mut state = 0;
+        if self.accepting[state] {
             return None;
         }
+        for &letter in word {
+            state = self.step(state, letter);
+            if self.accepting[state] {
+                return None;
+            }
+        }
+        Some(state)
+    }
 
-        let word: String = self
-            .prefix
-            .iter()
-            .map(|c| *c)
-            .chain(self.current.iter().map(|&i| self.alphabet[i]))
-            .collect();
-
-        // increment the current word
-        if self.current.len() == 0 {
-            self.done = true
-        } else {
-            for i in (0..self.current.len()).rev() {
-                if self.current[i] < self.alphabet.len() - 1 {
-                    self.current[i] += 1;
-                    break;
-                } else {
-                    self.current[i] = 0;
-                    if i == 0 {
-                        self.done = true;
+    /// Return the number of extensions of each length from 0 to max_length
+    /// that avoid the patterns, from the given state, or None if one of them
+    /// does not fit in a usize. This keeps track of how many avoiding
+    /// extensions of the current length end in each state.
+    fn count_avoiding_extensions(&self, state: usize, max_length: usize) -> Option<Vec<usize>> {
+        let mut counts = Vec::with_capacity(max_length + 1);
+        let mut histogram = vec![0usize; self.accepting.len()];
+        histogram[state] = 1;
+        for _ in 0..max_length {
+            counts.push(checked_sum(&histogram)?);
+            let mut following = vec![0usize; self.accepting.len()];
+            for (state, &count) in histogram.iter().enumerate() {
+                if count == 0 {
+                    continue;
+                }
+                let start = state * self.alphabet_size;
+                for &next in &self.transitions[start..start + self.alphabet_size] {
+                    if !self.accepting[next] {
+                        following[next] = following[next].checked_add(count)?;
                     }
                 }
             }
+            histogram = following;
         }
+        counts.push(checked_sum(&histogram)?);
+        Some(counts)
+    }
 
-        Some(word)
+    /// Call f on each extension of the given size of the word that still
+    /// avoids the patterns, where state is the state reached after reading the
+    /// word. The extensions are visited in lexicographic order.
+    fn for_each_avoiding_extension<F: FnMut(&[u8])>(
+        &self,
+        word: &mut Vec<u8>,
+        state: usize,
+        size: usize,
+        f: &mut F,
+    ) {
+        if word.len() == size {
+            f(word);
+            return;
+        }
+        for letter in 0..self.alphabet_size as u8 {
+            let next = self.step(state, letter);
+            if !self.accepting[next] {
+                word.push(letter);
+                self.for_each_avoiding_extension(word, next, size, f);
+                word.pop();
+            }
+        }
     }
 }
 
+/// Return the sum of the counts, or None if it does not fit in a usize.
+fn checked_sum(counts: &[usize]) -> Option<usize> {
+    counts
+        .iter()
+        .try_fold(0usize, |total, &count| total.checked_add(count))
+}
+
 /// A Python module implemented in Rust.
 #[pymodule]
 fn word_scope_rs(_py: Python, m: &PyModule) -> PyResult<()> {
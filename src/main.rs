@@ -6,7 +6,7 @@ fn main() {
     let patterns = vec![String::from("aaab")];
     let c = AvoidingWithPrefix::new(prefix, patterns, alphabet, false);
     for n in 0..10 {
-        let count = c.objects_of_size(n).count();
+        let count = c.count_objects_of_size(n);
         println!("{n}: {count}");
     }
 }